@@ -0,0 +1,35 @@
+from functools import cache
+import logging
+from typing import Callable
+
+_logger = logging.getLogger("lokomat_fes")
+
+
+def cond_jit(**kwargs) -> Callable[[Callable], Callable]:
+    """Decorator that compiles a function with [numba.njit] if numba is installed. Otherwise, the function is left
+    untouched, so numba remains an optional dependency.
+
+    Parameters
+    ----------
+    kwargs
+        The options sent to [numba.njit] (e.g. cache=True).
+
+    Returns
+    -------
+    The decorator
+    """
+    njit = _numba_njit()
+    if njit is None:
+        return lambda function: function
+    return njit(**kwargs)
+
+
+@cache
+def _numba_njit() -> Callable | None:
+    """Get [numba.njit] or None if numba is not installed (this is only logged once)."""
+    try:
+        from numba import njit
+    except ImportError:
+        _logger.info("numba is not installed, the analysis functions will run as pure Python")
+        return None
+    return njit
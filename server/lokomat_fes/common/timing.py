@@ -0,0 +1,106 @@
+import heapq
+from itertools import count
+import logging
+import threading
+import time
+from typing import Callable
+
+_logger = logging.getLogger("lokomat_fes")
+
+
+def precise_sleep(duration: float, spin_duration: float = 5e-4) -> None:
+    """Sleep for a duration with a sub-millisecond precision.
+
+    [time.sleep] can wake up late by a fraction of millisecond or more. To compensate, this sleeps for most of the
+    duration and actively waits for the remaining [spin_duration]. The active wait keeps releasing the GIL so the other
+    threads are not blocked.
+
+    Parameters
+    ----------
+    duration : float
+        The duration to sleep in seconds. Nothing is done if it is zero or negative.
+    spin_duration : float
+        The duration, at the end of the sleep, to actively wait for in seconds.
+    """
+    end = time.perf_counter() + duration
+    if duration > spin_duration:
+        time.sleep(duration - spin_duration)
+    while time.perf_counter() < end:
+        time.sleep(0)
+
+
+class TimerQueue:
+    """Call functions after a delay, all from a single background thread.
+
+    This serves the same purpose as starting a [threading.Timer] for each call, without creating a new thread each
+    time. The pending calls are kept in a heap sorted by deadline (monotonic clock), and the thread sleeps until the
+    earliest one is due. Like [threading.Timer], the thread is not a daemon, so the interpreter waits for the pending
+    calls before exiting. It stops as soon as no call is pending. Use [flush] to call the pending functions right away.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, Callable[[], None]]] = []
+        self._counter = count()  # Tie-breaker so two calls with the same deadline never compare their functions
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __len__(self) -> int:
+        """Get the number of pending calls."""
+        return len(self._heap)
+
+    def schedule(self, delay: float, function: Callable[[], None]) -> None:
+        """Call a function after a delay. This is non-blocking.
+
+        Parameters
+        ----------
+        delay : float
+            The delay in seconds before calling the function.
+        function : Callable[[], None]
+            The function to call.
+        """
+        deadline = time.monotonic() + delay
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._counter), function))
+            if self._thread is None:
+                # The thread only runs while calls are pending
+                self._thread = threading.Thread(target=self._run)
+                self._thread.start()
+        self._wakeup.set()
+
+    def flush(self) -> None:
+        """Call all the pending functions now (in deadline order) from the calling thread, instead of waiting for their
+        delay. This is useful to make sure they are called before disposing what they act on."""
+        with self._lock:
+            due = [heapq.heappop(self._heap)[2] for _ in range(len(self._heap))]
+        self._wakeup.set()
+        _call_all(due)
+
+    def _run(self) -> None:
+        """Call the functions as they come due."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+                if not due and not self._heap:
+                    # Nothing is pending anymore, so the thread stops (a new one is started by the next [schedule])
+                    self._thread = None
+                    return
+                timeout = self._heap[0][0] - now if self._heap else None
+                # Cleared while holding the lock so a call scheduled from now on wakes up the thread
+                self._wakeup.clear()
+
+            _call_all(due)
+            if not due:
+                self._wakeup.wait(timeout)
+
+
+def _call_all(functions: list[Callable[[], None]]) -> None:
+    """Call each function, logging the errors so the other functions are still called."""
+    for function in functions:
+        try:
+            function()
+        except Exception:
+            _logger.exception("Error while calling a scheduled function")
@@ -1,7 +1,9 @@
-from copy import deepcopy
 from datetime import datetime
 import logging
+from math import isnan
+from operator import attrgetter, methodcaller
 import pickle
+import threading
 from typing import Any
 
 from pyScienceMode import Channel as pyScienceModeChannel
@@ -9,6 +11,10 @@ import numpy as np
 
 
 _logger = logging.getLogger("lokomat_fes")
+_MINIMAL_CAPACITY = 16
+_CHANNEL_GETTERS = (attrgetter("channel_index"), attrgetter("amplitude"))
+_PYSCIENCEMODE_GETTERS = (methodcaller("get_no_channel"), methodcaller("get_amplitude"))
+_NPZ_MAGIC = b"PK\x03\x04"  # .npz files are zip archives
 
 
 class Channel:
@@ -22,10 +28,19 @@ class Channel:
         Amplitude of the stimulation.
     """
 
+    __slots__ = ("channel_index", "amplitude")
+
     def __init__(self, channel_index: int, amplitude: float) -> None:
         self.channel_index = channel_index
         self.amplitude = amplitude
 
+    def __setstate__(self, state: dict | tuple[None, dict]) -> None:
+        # Channels pickled before [__slots__] was introduced store their attributes in a plain dictionary
+        if isinstance(state, tuple):
+            state = state[1]
+        self.channel_index = state["channel_index"]
+        self.amplitude = state["amplitude"]
+
     @classmethod
     def from_pysciencemode(cls, channel: pyScienceModeChannel) -> "Channel":
         """Create a Channel from a pyScienceMode channel.
@@ -66,17 +81,41 @@ class Channel:
 class RehastimData:
     """Class to store data from Rehastim devices.
 
+    The data are stored as parallel arrays (one entry per stimulation event) which grow geometrically as new events
+    come in, so the accessors can slice them instead of walking every event. The events are added by the device thread
+    while they are read by others, so the reads and writes are guarded by a lock. The arrays are never moved in place,
+    so the views already returned are not modified when the arrays are grown or when the oldest events are dropped.
+
     Attributes
     ----------
-    _t0 : datetime
+    _t0 : float
         Starting time of the recording (set at the moment of the declaration of the class or that the
         time [set_t0] is called).
-    _data: list[tuple[datetime, float, float]]
-        List of data vectors.
-        Each vector is a tuple of (time [datetime], duration [float] ms, tuple of channels configuration).
+    _capacity : int | None
+        Maximum number of events kept. When it is reached, the oldest event is dropped for each new one. If None, all
+        the events are kept.
+    _lock : threading.RLock
+        Lock guarding the events stored.
+    _first : int
+        Index, in the arrays below, of the first event stored.
+    _n : int
+        Number of stimulation events stored (the arrays below may be larger than that).
+    _time : np.ndarray
+        Time [float] of each event.
+    _duration : np.ndarray
+        Duration [float] of each event. NaN means the duration is not known yet (it is set on the next event).
+    _channel_indices : np.ndarray
+        Index of each channel for each event (n_channels x capacity).
+    _amplitudes : np.ndarray
+        Amplitude of each channel for each event (n_channels x capacity).
     """
 
-    def __init__(self, t0: datetime = None, data: list[tuple[float, float, tuple[Channel, ...]]] = None) -> None:
+    def __init__(
+        self,
+        t0: datetime = None,
+        data: list[tuple[float, float, tuple[Channel, ...]]] = None,
+        capacity: int | None = None,
+    ) -> None:
         """Initialize the data.
 
         Parameters
@@ -86,10 +125,27 @@ class RehastimData:
         data : list[tuple[float, float, float]] | None
             List of data vectors.
             Each vector is a tuple of (time [float], duration [float] ms, tuple of channels configuration).
+        capacity : int | None
+            Maximum number of events to keep (only the most recent ones are kept), which bounds the memory used by long
+            recordings. If None, all the events are kept.
         """
+        if capacity is not None and capacity < 1:
+            raise ValueError("The capacity must be at least 1.")
+
         self._t0: float = None
         self.set_t0(new_t0=t0)
-        self._data: list[tuple[float, float, tuple[Channel, ...]]] = [] if data is None else data
+
+        self._capacity: int | None = capacity
+        self._lock = threading.RLock()
+        self._first: int = 0
+        self._n: int = 0
+        self._time: np.ndarray = None
+        self._duration: np.ndarray = None
+        self._channel_indices: np.ndarray = None
+        self._amplitudes: np.ndarray = None
+        self.clear()
+        if data is not None:
+            self._set_events(data)
 
     def __len__(self) -> int:
         """Get the number of samples.
@@ -99,7 +155,7 @@ class RehastimData:
         out : int
             Number of samples.
         """
-        return len(self._data)
+        return self._n
 
     @property
     def has_data(self) -> bool:
@@ -110,11 +166,29 @@ class RehastimData:
         out : bool
             True if the data has been initialized.
         """
-        return bool(self._data)
+        return self._n > 0
 
     def clear(self) -> None:
         """Clear the data."""
-        self._data = []
+        with self._lock:
+            self._first = 0
+            self._n = 0
+            # New arrays are used, so the views previously returned keep their content
+            self._time = np.empty(0, dtype=np.float64)
+            self._duration = np.empty(0, dtype=np.float64)
+            self._channel_indices = np.empty((0, 0), dtype=np.int16)
+            self._amplitudes = np.empty((0, 0), dtype=np.float64)
+
+    @property
+    def capacity(self) -> int | None:
+        """Get the maximum number of events kept (None if all the events are kept).
+
+        Returns
+        -------
+        out : int | None
+            Maximum number of events kept.
+        """
+        return self._capacity
 
     def plot(self, ax=None, show: bool = True) -> None | Any:
         """Plot the data.
@@ -185,23 +259,141 @@ class RehastimData:
         amplitude : float
             Amplitude of the stimulation.
         """
-        if channels is None:
-            # Copy the previous values
-            if not self.has_data:
-                raise RuntimeError("The first time you add data, you must specify the channels.")
-            channels = self._data[-1][2]
-        else:
-            # Make a copy of the channels to avoid modifying the original, if the channel is a pyScienceModeChannel
-            # we convert it to the simplified version (Channel)
-            channels = tuple(
-                Channel.from_pysciencemode(channel) if isinstance(channel, pyScienceModeChannel) else deepcopy(channel)
-                for channel in channels
-            )
-        if len(self._data) > 0 and self._data[-1][1] is None:
-            # If the previous duration was None, we set it to the current time
-            self._data[-1] = (self._data[-1][0], now - self._data[-1][0], self._data[-1][2])
+        with self._lock:
+            if channels is None:
+                # Copy the previous values
+                if not self.has_data:
+                    raise RuntimeError("The first time you add data, you must specify the channels.")
+                last = self._first + self._n - 1
+                channel_indices = self._channel_indices[:, last]
+                amplitudes = self._amplitudes[:, last]
+            else:
+                # The values are read on every call, even if the same channels are sent again: the devices keep a single
+                # list of channels that they modify in place when the stimulation changes (see
+                # [Rehastim2.set_pulse_amplitude]). A device sends channels of a single type, so the getters are chosen
+                # once from the first channel
+                is_pysciencemode = bool(channels) and isinstance(channels[0], pyScienceModeChannel)
+                get_channel_index, get_amplitude = _PYSCIENCEMODE_GETTERS if is_pysciencemode else _CHANNEL_GETTERS
+                try:
+                    channel_indices = list(map(get_channel_index, channels))
+                    amplitudes = list(map(get_amplitude, channels))
+                except AttributeError:
+                    # The channels are of mixed types, so pyScienceModeChannel are converted to the simplified version
+                    channels = tuple(
+                        Channel.from_pysciencemode(channel) if isinstance(channel, pyScienceModeChannel) else channel
+                        for channel in channels
+                    )
+                    channel_indices = list(map(attrgetter("channel_index"), channels))
+                    amplitudes = list(map(attrgetter("amplitude"), channels))
+
+            last = self._first + self._n - 1
+            if self._n > 0 and isnan(self._duration[last]):
+                # If the previous duration was None, we set it to the current time
+                self._duration[last] = now - self._time[last]
+
+            self._append(now, np.nan if duration is None else duration, channel_indices, amplitudes)
+
+    def _append(
+        self, now: float, duration: float, channel_indices: list[int] | np.ndarray, amplitudes: list[float] | np.ndarray
+    ) -> None:
+        """Append an event to the arrays, growing them if needed. If the capacity is reached, the oldest event is dropped.
+
+        The events are stored in the window [_first, _first + _n) of the arrays, so they can always be returned as views.
+        When the capacity is bounded, the arrays hold at most twice the capacity: once the window reaches their end, it
+        is copied at the beginning of new arrays, which costs at most one copy of the events every [capacity] appends.
+        This must be called while holding the lock.
+
+        Parameters
+        ----------
+        now : float
+            Timestamp of the event.
+        duration : float
+            Duration of the event (NaN if it is not known yet).
+        channel_indices : list[int] | np.ndarray
+            Index of each channel.
+        amplitudes : list[float] | np.ndarray
+            Amplitude of each channel.
+        """
+        nb_channels = len(channel_indices)
+        if nb_channels != self._amplitudes.shape[0]:
+            if self._n > 0:
+                raise ValueError("The number of channels cannot change during a recording.")
+            # The number of channels is only known when the first event comes in
+            self._channel_indices = np.empty((nb_channels, self._time.shape[0]), dtype=np.int16)
+            self._amplitudes = np.empty((nb_channels, self._time.shape[0]), dtype=np.float64)
+
+        if self._n == self._capacity:
+            self._first += 1
+            self._n -= 1
+
+        end = self._first + self._n
+        if end == self._time.shape[0]:
+            capacity = max(2 * end, _MINIMAL_CAPACITY)
+            if self._capacity is not None:
+                capacity = min(capacity, 2 * self._capacity)
+            self._time = _resized(self._time[self._first : end], self._n, capacity)
+            self._duration = _resized(self._duration[self._first : end], self._n, capacity)
+            self._channel_indices = _resized(self._channel_indices[:, self._first : end], self._n, capacity)
+            self._amplitudes = _resized(self._amplitudes[:, self._first : end], self._n, capacity)
+            self._first = 0
+            end = self._n
+
+        self._time[end] = now
+        self._duration[end] = duration
+        self._channel_indices[:, end] = channel_indices
+        self._amplitudes[:, end] = amplitudes
+        self._n += 1
+
+    def _set_events(self, data: list[tuple[float, float | None, tuple[Channel, ...]]]) -> None:
+        """Replace the data by events given as a list of (time, duration, channels), as returned by [sample_block].
+
+        Parameters
+        ----------
+        data : list[tuple[float, float | None, tuple[Channel, ...]]]
+            The events. All of them must have the same number of channels. If there are more events than the capacity,
+            only the most recent ones are kept.
+        """
+        if self._capacity is not None:
+            data = data[-self._capacity :]
+        self._first = 0
+        self._n = len(data)
+        if not data:
+            return
 
-        self._data.append((now, duration, channels))
+        # The size and type of each array are known, so they are filled directly without intermediate lists
+        nb_channels = len(data[0][2])
+        get_channel_index, get_amplitude = _CHANNEL_GETTERS
+        self._time = np.fromiter((event[0] for event in data), dtype=np.float64, count=self._n)
+        self._duration = np.fromiter(
+            (np.nan if event[1] is None else event[1] for event in data), dtype=np.float64, count=self._n
+        )
+        self._channel_indices = np.ascontiguousarray(
+            np.fromiter(
+                (tuple(map(get_channel_index, event[2])) for event in data),
+                dtype=(np.int16, nb_channels),
+                count=self._n,
+            ).T
+        )
+        self._amplitudes = np.ascontiguousarray(
+            np.fromiter(
+                (tuple(map(get_amplitude, event[2])) for event in data), dtype=(np.float64, nb_channels), count=self._n
+            ).T
+        )
+
+    def _sample(self, index: int) -> tuple[float, float | None, tuple[Channel, ...]]:
+        """Reconstruct the event at [index] (which must be a valid positive index)."""
+        index += self._first
+        duration = float(self._duration[index])
+        return (
+            float(self._time[index]),
+            None if isnan(duration) else duration,
+            tuple(
+                Channel(channel_index, amplitude)
+                for channel_index, amplitude in zip(
+                    self._channel_indices[:, index].tolist(), self._amplitudes[:, index].tolist()
+                )
+            ),
+        )
 
     def sample_block(
         self, index: int | slice
@@ -222,10 +414,14 @@ class RehastimData:
         amplitude : float
             Amplitude of the stimulation.
         """
-        if not self._data:
-            return None
+        with self._lock:
+            if not self.has_data:
+                return None
 
-        return self._data[index]
+            indices = range(self._n)[index]
+            if isinstance(indices, range):
+                return [self._sample(i) for i in indices]
+            return self._sample(indices)
 
     def sample_block_between(self, t0: float, tf: float) -> list[tuple[datetime, float, tuple[Channel, ...]]]:
         """Get a block of data between two times.
@@ -243,26 +439,23 @@ class RehastimData:
             List of data vectors.
             Each vector is a tuple of (time [datetime], duration [float] ms, tuple of channels configuration).
         """
-        if not self._data:
-            return []
-
-        time = self.time
-
-        first_index = None
-        for i in range(len(time)):
-            if time[i] >= t0:
-                first_index = i
-                break
-        else:
-            return []
+        with self._lock:
+            if not self.has_data:
+                return []
 
-        last_index = 0
-        for i in reversed(range(len(time))):
-            if time[i] <= tf:
-                last_index = i
-                break
+            # Events are added chronologically, so the time vector is sorted
+            time = self.time
+            first_index = np.searchsorted(time, t0, side="left")
+            last_index = np.searchsorted(time, tf, side="right")
+            return self.sample_block(slice(first_index, last_index))
 
-        return self.sample_block(slice(first_index, last_index + 1))
+    @property
+    def _nb_defined(self) -> int:
+        """Number of events which duration is known. Only the last event can be undefined, as its duration is set when
+        the next event comes in, so the defined events are always the first ones."""
+        if self._n > 0 and isnan(self._duration[self._first + self._n - 1]):
+            return self._n - 1
+        return self._n
 
     @property
     def time(self) -> np.ndarray:
@@ -271,12 +464,13 @@ class RehastimData:
         Returns
         -------
         t : np.ndarray
-            Time vector of the data.
+            Time vector of the data. This is a read-only view on the data.
         """
-        if not self._data:
-            return np.array([])
+        with self._lock:
+            if not self.has_data:
+                return np.array([])
 
-        return np.array([t for t, duration, _ in self._data if duration is not None])
+            return _read_only(self._time[self._first : self._first + self._nb_defined])
 
     @property
     def duration_as_array(self) -> np.ndarray:
@@ -288,12 +482,13 @@ class RehastimData:
         Returns
         -------
         data : np.ndarray
-            Duration of each stimulation
+            Duration of each stimulation. This is a read-only view on the data.
         """
-        if not self._data:
-            return np.array([[]])
+        with self._lock:
+            if not self.has_data:
+                return np.array([[]])
 
-        return np.array([duration for _, duration, _ in self._data if duration is not None])
+            return _read_only(self._duration[self._first : self._first + self._nb_defined])
 
     @property
     def amplitude_as_array(self) -> np.ndarray:
@@ -305,18 +500,13 @@ class RehastimData:
         Returns
         -------
         data : np.ndarray
-            Amplitude of each stimulation
+            Amplitude of each stimulation. This is a read-only view on the data.
         """
-        if not self._data:
-            return np.array([[]])
+        with self._lock:
+            if not self.has_data:
+                return np.array([[]])
 
-        return np.array(
-            [
-                [channel.amplitude for channel in channels]
-                for _, duration, channels in self._data
-                if duration is not None
-            ]
-        ).T
+            return _read_only(self._amplitudes[:, self._first : self._first + self._nb_defined])
 
     @property
     def copy(self) -> "RehastimData":
@@ -328,10 +518,16 @@ class RehastimData:
             Copy of the data.
         """
 
-        out = RehastimData()
-        out._t0 = self._t0
-        out._data = deepcopy(self._data)
-        return out
+        with self._lock:
+            end = self._first + self._n
+            out = RehastimData(capacity=self._capacity)
+            out._t0 = self._t0
+            out._n = self._n
+            out._time = self._time[self._first : end].copy()
+            out._duration = self._duration[self._first : end].copy()
+            out._channel_indices = self._channel_indices[:, self._first : end].copy()
+            out._amplitudes = self._amplitudes[:, self._first : end].copy()
+            return out
 
     def save(self, path: str) -> None:
         """Save the data to a file.
@@ -342,8 +538,9 @@ class RehastimData:
             Path to the file.
         """
 
+        # The file handle is given to numpy, otherwise it appends the ".npz" extension to the path
         with open(path, "wb") as f:
-            pickle.dump(self.serialize(), f)
+            np.savez_compressed(f, **self.serialize())
 
     @classmethod
     def load(cls, path: str) -> "RehastimData":
@@ -352,7 +549,7 @@ class RehastimData:
         Parameters
         ----------
         path : str
-            Path to the file.
+            Path to the file. Files pickled by previous versions are also accepted.
 
         Returns
         -------
@@ -361,7 +558,14 @@ class RehastimData:
         """
 
         with open(path, "rb") as f:
-            data = pickle.load(f)
+            is_npz = f.read(len(_NPZ_MAGIC)) == _NPZ_MAGIC
+            f.seek(0)
+            if is_npz:
+                with np.load(f) as npz:
+                    data = {key: npz[key] for key in npz.files}
+                data["t0"] = float(data["t0"])
+            else:
+                data = pickle.load(f)
         return cls.deserialize(data)
 
     def serialize(self, to_json: bool = False) -> dict:
@@ -370,20 +574,35 @@ class RehastimData:
         Parameters
         ----------
         to_json : bool
-            Whether to convert the data to json or not. If False, the numpy arrays are kept as numpy arrays. If True,
-            they are converted to lists. Default is False. Note that this is only useful if you want to save the data
-            to a json file. The resulting dictionary will not be able to be deserialized using the deserialize method.
+            Whether to convert the data to json or not. If False, the numpy arrays are kept as numpy arrays (read-only
+            views on the data). If True, they are converted to a list of (time, duration, channels) events. Default is
+            False. Note that this is only useful if you want to save the data to a json file. The resulting dictionary
+            will not be able to be deserialized using the deserialize method.
 
         Returns
         -------
         out : dict
-            Serialized data.
+            Serialized data. The capacity is only written if it is bounded.
         """
-        if to_json:
-            data = [list((d[0], d[1], tuple(channel.serialize(to_json=True) for channel in d[2]))) for d in self._data]
-        else:
-            data = self._data
-        return {"t0": self._t0, "data": data}
+        with self._lock:
+            if to_json:
+                data = [
+                    list((d[0], d[1], tuple(channel.serialize(to_json=True) for channel in d[2])))
+                    for d in (self._sample(i) for i in range(self._n))
+                ]
+                out = {"t0": self._t0, "data": data}
+            else:
+                end = self._first + self._n
+                out = {
+                    "t0": self._t0,
+                    "time": _read_only(self._time[self._first : end]),
+                    "duration": _read_only(self._duration[self._first : end]),
+                    "channel_indices": _read_only(self._channel_indices[:, self._first : end]),
+                    "amplitudes": _read_only(self._amplitudes[:, self._first : end]),
+                }
+            if self._capacity is not None:
+                out["capacity"] = self._capacity
+            return out
 
     @classmethod
     def deserialize(cls, data: dict) -> "RehastimData":
@@ -392,14 +611,38 @@ class RehastimData:
         Parameters
         ----------
         data : dict
-            Serialized data.
+            Serialized data. The list of events used by previous versions (under the "data" key) is also accepted.
 
         Returns
         -------
         out : RehastimData
             Deserialized data.
         """
-        out = cls()
+        capacity = data.get("capacity")
+        out = cls(capacity=None if capacity is None else int(capacity))
         out._t0 = data["t0"]
-        out._data = data["data"]
+        if "data" in data:
+            out._set_events(data["data"])
+            return out
+
+        # Only the most recent events are kept if there are more than the capacity
+        first = 0 if capacity is None else -int(capacity)
+        out._time = np.array(data["time"], dtype=np.float64)[first:]
+        out._duration = np.array(data["duration"], dtype=np.float64)[first:]
+        out._channel_indices = np.array(data["channel_indices"], dtype=np.int16)[:, first:]
+        out._amplitudes = np.array(data["amplitudes"], dtype=np.float64)[:, first:]
+        out._n = out._time.shape[0]
         return out
+
+
+def _resized(array: np.ndarray, n: int, capacity: int) -> np.ndarray:
+    """Copy the first [n] elements of the last axis of [array] into a new array of [capacity] elements on that axis."""
+    out = np.empty(array.shape[:-1] + (capacity,), dtype=array.dtype)
+    out[..., :n] = array[..., :n]
+    return out
+
+
+def _read_only(view: np.ndarray) -> np.ndarray:
+    """Prevent the caller from modifying the data through [view] (the data themselves remain writable)."""
+    view.flags.writeable = False
+    return view
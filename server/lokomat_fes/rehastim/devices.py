@@ -1,10 +1,32 @@
-from datetime import datetime
-from threading import Timer
-from typing import override, Any, Callable
+from functools import cache
+import time
+from typing import override, Any, Callable, TYPE_CHECKING
 from abc import ABC, abstractproperty, abstractmethod
 
 from pyScienceMode import Channel, RehastimGeneric as pyScienceModeRehastimGeneric
 
+from ..common.timing import TimerQueue
+
+if TYPE_CHECKING:
+    from pyScienceMode.devices.rehastim2 import Rehastim2 as pyScienceModeRehastim2
+    from pyScienceMode.devices.rehastimP24 import RehastimP24 as pyScienceModeRehastimP24
+
+
+@cache
+def _pysciencemode_rehastim2() -> type["pyScienceModeRehastim2"]:
+    """Get the pyScienceMode Rehastim2 device class, which is only imported the first time it is needed."""
+    from pyScienceMode.devices.rehastim2 import Rehastim2 as pyScienceModeRehastim2
+
+    return pyScienceModeRehastim2
+
+
+@cache
+def _pysciencemode_rehastim_p24() -> type["pyScienceModeRehastimP24"]:
+    """Get the pyScienceMode RehastimP24 device class, which is only imported the first time it is needed."""
+    from pyScienceMode.devices.rehastimP24 import RehastimP24 as pyScienceModeRehastimP24
+
+    return pyScienceModeRehastimP24
+
 
 class RehastimGeneric(ABC):
     """
@@ -19,6 +41,8 @@ class RehastimGeneric(ABC):
         self._device = self._get_initialized_device()
         self._on_stimulation_changed_callback: dict[Any, Callable[[], None]] = {}
         self._is_stimulation_initialized = False
+        # Stops the stimulations that were started for a specific duration
+        self._stop_stimulation_timers = TimerQueue()
 
     @abstractproperty
     def device_name(self) -> str:
@@ -59,12 +83,12 @@ class RehastimGeneric(ABC):
 
         # Notify the listeners that the stimulation is starting
         channels = self._get_channels()
-        now = datetime.now().timestamp()
+        now = time.time()
         for callback in self._on_stimulation_changed_callback.values():
             callback(now, duration, channels)
 
         if duration is not None:
-            Timer(duration, self.stop_stimulation).start()
+            self._stop_stimulation_timers.schedule(duration, self.stop_stimulation)
 
     @abstractmethod
     def set_pulse_amplitude(self, amplitudes: float | list[float]) -> None:
@@ -120,13 +144,15 @@ class RehastimGeneric(ABC):
         self._device.pause_stimulation()
 
         # Notify the listeners that the stimulation is stopping
-        now = datetime.now().timestamp()
+        now = time.time()
         channels = self._get_channels()
         for callback in self._on_stimulation_changed_callback.values():
             callback(now, 0, channels)
 
     def dispose(self) -> None:
         """Dispose the device."""
+        # The stimulations started for a specific duration are stopped before the device goes away
+        self._stop_stimulation_timers.flush()
         self._device.end_stimulation()
         self._device.disconnect()
         self._device.close_port()
@@ -189,15 +215,11 @@ class Rehastim2(RehastimGeneric):
 
     @override
     def _get_initialized_device(self) -> pyScienceModeRehastimGeneric:
-        from pyScienceMode.devices.rehastim2 import Rehastim2 as pyScienceModeRehastim2
-
-        return pyScienceModeRehastim2(port=self.port, show_log=self.show_log)
+        return _pysciencemode_rehastim2()(port=self.port, show_log=self.show_log)
 
     @override
     def _initialize_stimulation(self) -> None:
-        from pyScienceMode.devices.rehastim2 import Rehastim2 as pyScienceModeRehastim2
-
-        self._device: pyScienceModeRehastim2
+        self._device: "pyScienceModeRehastim2"
         self._device.init_channel(
             stimulation_interval=self._default_stimulation_interval,
             list_channels=self._channels,
@@ -282,15 +304,11 @@ class RehastimP24(RehastimGeneric):
 
     @override
     def _get_initialized_device(self) -> pyScienceModeRehastimGeneric:
-        from pyScienceMode.devices.rehastimP24 import RehastimP24 as pyScienceModeRehastimP24
-
-        return pyScienceModeRehastimP24(port=self.port, show_log=self.show_log)
+        return _pysciencemode_rehastim_p24()(port=self.port, show_log=self.show_log)
 
     @override
     def _initialize_stimulation(self) -> None:
-        from pyScienceMode.devices.rehastimP24 import RehastimP24 as pyScienceModeRehastimP24
-
-        self._device: pyScienceModeRehastimP24
+        self._device: "pyScienceModeRehastimP24"
         self._device.init_stimulation(list_channels=self.get_channels())
 
     @override
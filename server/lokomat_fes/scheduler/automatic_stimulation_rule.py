@@ -2,6 +2,7 @@ from functools import partial
 from operator import gt, ge, lt, le
 from typing import Callable
 
+import numpy as np
 
 from ..common.data import Data
 from .data_analyser import Side, DataAnalyser, GaitEvent
@@ -30,8 +31,16 @@ class AutomaticStimulationRule:
         self._name = name
         self._channels = channels
         self._amplitudes = amplitudes
+        # The (channel, amplitude) pairs are written on every start, so they are paired once as an immutable tuple
+        self._pulse: tuple[tuple[int, float], ...] = tuple(zip(channels, amplitudes))
         self._started_stimulating_at: float | None = None
 
+        # The stride percentages only change when new NiDaq data come in, which is much slower than the scheduler
+        # ticks, so they are kept along with the last data block they were computed from
+        self._last_nidaq_block: np.ndarray | None = None
+        self._last_stride_left: float = -1
+        self._last_stride_right: float = -1
+
         if start_stimulating_rule is None:
             raise ValueError("start_stimulating_rule cannot be None")
         self._start_stimulating_rule = start_stimulating_rule
@@ -73,31 +82,35 @@ class AutomaticStimulationRule:
             Whether to stimulate or not.
         """
         # Get where we are in a stride cycle and whether we should stimulate or not channels
-        stride_left = DataAnalyser.percentage_of_stride(data, Side.LEFT)
-        stride_right = DataAnalyser.percentage_of_stride(data, Side.RIGHT)
+        _, last_nidaq_block = data.nidaq.sample_block(index=-1, unsafe=True)
+        if last_nidaq_block is not self._last_nidaq_block:
+            self._last_nidaq_block = last_nidaq_block
+            self._last_stride_left, self._last_stride_right = DataAnalyser.percentage_of_strides(data)
+        stride_left = self._last_stride_left
+        stride_right = self._last_stride_right
         if stride_left < 0 or stride_right < 0:
             return
 
-        time_since_last_stim = (
-            current_time - self._started_stimulating_at if self._started_stimulating_at is not None else None
-        )
-        start = self._start_stimulating_rule(time_since_last_stim, stride_left, stride_right)
+        # Only the rules that can change the current state are evaluated: while idle, only the starting rule matters,
+        # while stimulating, only the stopping rules do.
+        if self._started_stimulating_at is None:
+            if self._start_stimulating_rule(None, stride_left, stride_right):
+                self._started_stimulating_at = current_time
+                for i, amplitude in self._pulse:
+                    amplitude_out[i] = amplitude
+            return
+
+        time_since_last_stim = current_time - self._started_stimulating_at
         if self._continue_stimulating_rule is not None:
-            stop = not start or not self._continue_stimulating_rule(time_since_last_stim, stride_left, stride_right)
+            stop = not self._start_stimulating_rule(
+                time_since_last_stim, stride_left, stride_right
+            ) or not self._continue_stimulating_rule(time_since_last_stim, stride_left, stride_right)
         else:
             stop = self._end_stimulating_rule(time_since_last_stim, stride_left, stride_right)
 
-        if self._started_stimulating_at is not None and stop:
-            # We don't mind if start is set as if we get to stop we will stop anyway
+        if stop:
             self._started_stimulating_at = None
-            for index in range(len(amplitude_out)):
-                amplitude_out[index] = 0
-            return
-        elif self._started_stimulating_at is None and start:
-            self._started_stimulating_at = current_time
-            for amplitude_index, i in enumerate(self._channels):
-                amplitude_out[i] = self._amplitudes[amplitude_index]
-            return
+            amplitude_out[:] = (0,) * len(amplitude_out)
 
     def __str__(self) -> str:
         return self.name
@@ -3,6 +3,7 @@ from enum import Enum, auto
 import numpy as np
 
 from ..common.data import Data
+from ..common.jit import cond_jit
 
 
 class Side(Enum):
@@ -36,36 +37,67 @@ class DataAnalyser:
         float
             The percentage of the stride cycle [0; 1].
         """
+        left, right = DataAnalyser.percentage_of_strides(data)
+        return right if side == Side.RIGHT else left
+
+    @staticmethod
+    def percentage_of_strides(data: Data) -> tuple[float, float]:
+        """Get the percentage of the stride cycle of both sides at once. This is faster than calling
+        [percentage_of_stride] for each side as the data are only processed once.
+
+        Parameters
+        ----------
+        data : Data
+            The data to use.
+
+        Returns
+        -------
+        tuple[float, float]
+            The percentage of the stride cycle [0; 1] of the left and right sides (-1 if it cannot be computed).
+        """
 
         if len(data.nidaq) < 2:
-            return -1  # Not enough data
+            return -1, -1  # Not enough data
 
         # Get the last two samples
         _, previous_data = data.nidaq.sample_block(index=-2, unsafe=True)
         _, current_data = data.nidaq.sample_block(index=-1, unsafe=True)
         if previous_data is None or current_data is None:
-            return -1  # Not enough data
-
-        previous_hip = np.mean(previous_data[0])
-        current_hip = np.mean(current_data[0])
-        if side == Side.RIGHT:
-            # Simulate the right side by inverting the sign of the hip channel
-            previous_hip = -previous_hip
-            current_hip = -current_hip
-
-        # The first channel is a sin wave, so
-        #   if the value is [0; 1] and is increasing, we are in the first quarter of the stride cycle
-        #   if the value is [0; 1] and is decreasing, we are in the second quarter of the stride cycle
-        #   if the value is [0; -1] and is decreasing, we are in the third quarter of the stride cycle
-        #   if the value is [0; -1] and is increasing, we are in the fourth quarter of the stride cycle
-        # We return a linear interpolation of the percentage of the stride cycle we are in
-        if current_hip >= 0 and current_hip > previous_hip:
-            return 0 + 0.25 * current_hip
-        elif current_hip >= 0 and current_hip < previous_hip:
-            return 0.25 + 0.25 * (1 - current_hip)
-        elif current_hip < 0 and current_hip < previous_hip:
-            return 0.5 + 0.25 * np.abs(previous_hip)
-        elif current_hip < 0 and current_hip > previous_hip:
-            return 0.75 + 0.25 * (1 - np.abs(previous_hip))
-        else:
-            return -1  # Error
+            return -1, -1  # Not enough data
+
+        return _percentage_of_strides(previous_data[0], current_data[0])
+
+
+@cond_jit(cache=True)
+def _percentage_of_strides(previous_hips: np.ndarray, current_hips: np.ndarray) -> tuple[float, float]:
+    """Compute the percentage of the stride cycle of both sides from the previous and current hip samples."""
+    previous_hip = previous_hips.mean()
+    current_hip = current_hips.mean()
+
+    # Simulate the right side by inverting the sign of the hip channel
+    return (
+        _percentage_of_stride(previous_hip, current_hip),
+        _percentage_of_stride(-previous_hip, -current_hip),
+    )
+
+
+@cond_jit(cache=True)
+def _percentage_of_stride(previous_hip: float, current_hip: float) -> float:
+    """Compute the percentage of the stride cycle from the mean of the previous and current hip samples."""
+
+    # The first channel is a sin wave, so
+    #   if the value is [0; 1] and is increasing, we are in the first quarter of the stride cycle
+    #   if the value is [0; 1] and is decreasing, we are in the second quarter of the stride cycle
+    #   if the value is [0; -1] and is decreasing, we are in the third quarter of the stride cycle
+    #   if the value is [0; -1] and is increasing, we are in the fourth quarter of the stride cycle
+    # We return a linear interpolation of the percentage of the stride cycle we are in
+    if current_hip >= 0 and current_hip > previous_hip:
+        return 0 + 0.25 * current_hip
+    elif current_hip >= 0 and current_hip < previous_hip:
+        return 0.25 + 0.25 * (1 - current_hip)
+    elif current_hip < 0 and current_hip < previous_hip:
+        return 0.5 + 0.25 * abs(previous_hip)
+    elif current_hip < 0 and current_hip > previous_hip:
+        return 0.75 + 0.25 * (1 - abs(previous_hip))
+    else:
+        return -1  # Error
@@ -1,4 +1,3 @@
-from datetime import datetime
 import json
 import logging
 import os
@@ -7,9 +6,11 @@ import time
 
 from .automatic_stimulation_rule import AutomaticStimulationRule
 from ..common.data import Data
+from ..common.timing import precise_sleep
 
 logger = logging.getLogger("lokomat_fes")
 _mutex = threading.Lock()
+_TICK_PERIOD = 0.001  # The stimulations are checked every millisecond
 
 
 class Scheduler:
@@ -23,6 +24,11 @@ class Scheduler:
         self.available_schedules: list[AutomaticStimulationRule] = _default_schedules(self)
         self._schedules: dict[int, AutomaticStimulationRule] = {}
 
+        # The amplitudes requested by the stimulations at each tick. The list is reused from one tick to another, it is
+        # therefore only reset after a change is sent (the receivers must not keep a reference to it)
+        self._amplitudes: list[float | None] = [None] * self._runner.nb_channels_rehastim
+        self._unchanged_amplitudes: tuple[None, ...] = tuple(self._amplitudes)
+
         # Start a thread that will run the scheduler at each millisecond to check whether to stimulate or not
         self._is_paused = False
         self._exit_flag = False
@@ -71,29 +77,41 @@ class Scheduler:
 
     def _run(self) -> None:
         """Run the scheduler to check whether to stimulate or not."""
+        # These do not change while the scheduler runs, so they are only looked up once (the view on the schedules
+        # reflects any stimulation added or removed afterwards)
+        data = self._data
+        schedules = self._schedules.values()
+        amplitudes = self._amplitudes
+        unchanged_amplitudes = self._unchanged_amplitudes
+        nb_channels = len(amplitudes)
+        perf_counter = time.perf_counter
+
+        next_tick = perf_counter()
         while True:
             if self._exit_flag:
                 break
 
+            # Wait for the next tick. If the previous one took too long, the missed ticks are skipped
+            next_tick = max(next_tick + _TICK_PERIOD, perf_counter())
+            precise_sleep(next_tick - perf_counter())
+
             if self._is_paused:
-                time.sleep(0)
                 continue
 
-            t = datetime.now().timestamp() - self._data.t0.timestamp()
+            t = time.time() - data.t0.timestamp()
 
             _mutex.acquire()
             # Get all the stimulations to check whether to stimulate or not
-            amplitudes = [None] * self._runner.nb_channels_rehastim
-            for stimulation in self._schedules.values():
-                stimulation.stimulation_amplitudes(t, self._data, amplitudes)
+            for stimulation in schedules:
+                stimulation.stimulation_amplitudes(t, data, amplitudes)
 
-            if any(e is not None for e in amplitudes):
+            if amplitudes.count(None) != nb_channels:
                 self._runner.set_stimulation_pulse_amplitude(amplitudes=amplitudes)
                 logger.info(f"Starting or modifying a stimulation (amplitude 0 acting as stopping the stimulation)")
                 self._runner.start_stimulation()
+                amplitudes[:] = unchanged_amplitudes
 
             _mutex.release()
-            time.sleep(0)
 
 
 def _default_schedules(self) -> list[AutomaticStimulationRule]:
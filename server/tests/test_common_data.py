@@ -94,7 +94,9 @@ def test_serialize_data():
     # Check that the data is correct
     assert serialized_data["t0"] == data.t0.timestamp()
     assert serialized_data["nidaq"] == data.nidaq.serialize()
-    assert serialized_data["rehastim"] == data.rehastim.serialize()
+    assert serialized_data["rehastim"].keys() == data.rehastim.serialize().keys()
+    for key, value in data.rehastim.serialize().items():
+        np.testing.assert_almost_equal(serialized_data["rehastim"][key], value)
 
     # Serialize the data for json
     serialized_data = data.serialize(to_json=True)
@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from lokomat_fes.common.timing import TimerQueue, precise_sleep
+
+# The timeouts only prevent a failing test from hanging, they are not expected to be reached
+_TIMEOUT = 10
+
+
+def test_timer_queue_calls_after_delay():
+    timers = TimerQueue()
+    called_at = []
+    is_called = threading.Event()
+
+    def call():
+        called_at.append(time.perf_counter())
+        is_called.set()
+
+    # The function is called once the delay is elapsed
+    initial_time = time.perf_counter()
+    timers.schedule(0.05, call)
+    assert is_called.wait(_TIMEOUT)
+    assert len(called_at) == 1
+    assert called_at[0] - initial_time >= 0.05
+    assert len(timers) == 0
+
+
+def test_timer_queue_calls_in_deadline_order():
+    timers = TimerQueue()
+    called = []
+    is_done = threading.Event()
+
+    def call_last():
+        called.append(3)
+        is_done.set()
+
+    # Schedule in reverse order, including two calls with the same delay
+    timers.schedule(0.15, call_last)
+    timers.schedule(0.1, lambda: called.append(2))
+    timers.schedule(0.05, lambda: called.append(1))
+    timers.schedule(0.05, lambda: called.append(1))
+
+    assert is_done.wait(_TIMEOUT)
+    assert called == [1, 1, 2, 3]
+
+
+def test_timer_queue_survives_errors():
+    timers = TimerQueue()
+    is_called = threading.Event()
+
+    def raise_error():
+        raise RuntimeError("Error in the scheduled function")
+
+    timers.schedule(0.01, raise_error)
+    timers.schedule(0.05, is_called.set)
+
+    assert is_called.wait(_TIMEOUT)
+
+
+def test_timer_queue_flush():
+    timers = TimerQueue()
+    called = []
+
+    # Scheduling is non-blocking
+    timers.schedule(_TIMEOUT * 2, lambda: called.append(2))
+    timers.schedule(_TIMEOUT, lambda: called.append(1))
+    assert len(timers) == 2
+    assert called == []
+
+    # The pending calls are made right away, in deadline order, and the thread stops as nothing is pending anymore
+    thread = timers._thread
+    timers.flush()
+    assert called == [1, 2]
+    assert len(timers) == 0
+    thread.join(_TIMEOUT)
+    assert not thread.is_alive()
+    assert called == [1, 2]
+
+
+def test_timer_queue_thread_lifetime():
+    timers = TimerQueue()
+    release = threading.Event()
+
+    # The thread is not a daemon while calls are pending, so the interpreter does not drop them when exiting
+    timers.schedule(0, lambda: release.wait(_TIMEOUT))
+    thread = timers._thread
+    assert thread is not None
+    assert not thread.daemon
+
+    # It stops when nothing is pending anymore and is started again by the next call
+    release.set()
+    thread.join(_TIMEOUT)
+    assert not thread.is_alive()
+    is_called = threading.Event()
+    timers.schedule(0.01, is_called.set)
+    assert is_called.wait(_TIMEOUT)
+
+
+def test_timer_queue_pending_calls_made_at_exit():
+    # The interpreter exits right after scheduling, while the call is still pending
+    code = (
+        "from lokomat_fes.common.timing import TimerQueue\n"
+        "TimerQueue().schedule(0.2, lambda: print('called', flush=True))\n"
+    )
+    server_folder = os.path.join(os.path.dirname(__file__), "..")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((server_folder, os.environ.get("PYTHONPATH", ""))))
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=_TIMEOUT)
+    assert output.returncode == 0
+    assert output.stdout == "called\n"
+
+
+def test_precise_sleep():
+    for duration in (0.0001, 0.001, 0.01):
+        initial_time = time.perf_counter()
+        precise_sleep(duration)
+        # Only the lower bound is checked, as the OS can delay the thread after the sleep on shared machines
+        assert time.perf_counter() - initial_time >= duration
+
+    # Negative durations do not sleep (the bound is loose for the same reason)
+    initial_time = time.perf_counter()
+    precise_sleep(-1)
+    assert time.perf_counter() - initial_time < 0.05
@@ -3,6 +3,8 @@ import json
 import os
 import pickle
 import pytest
+import sys
+import threading
 import time
 
 from lokomat_fes.rehastim.data import RehastimData, Channel
@@ -32,7 +34,7 @@ def _generate_data(rehastim_data: RehastimData):
 
 def test_data_creation():
     rehastim_data = RehastimData()
-    assert rehastim_data._data == []
+    assert len(rehastim_data) == 0
     assert rehastim_data.time.shape == (0,)
     assert rehastim_data.duration_as_array.shape == (1, 0)
     assert rehastim_data.amplitude_as_array.shape == (1, 0)
@@ -179,9 +181,9 @@ def test_copy_rehastim_data():
     np.testing.assert_almost_equal(rehastim_data_copy.amplitude_as_array, rehastim_data.amplitude_as_array)
 
     # The copy is a deep copy
-    rehastim_data_copy._data[1] = (0, 0, 0)
-    np.testing.assert_almost_equal(rehastim_data_copy._data[1][1:][0], 0)
-    np.testing.assert_almost_equal(rehastim_data._data[1][1:][0], 4)
+    rehastim_data_copy._duration[1] = 0
+    np.testing.assert_almost_equal(rehastim_data_copy.duration_as_array[1], 0)
+    np.testing.assert_almost_equal(rehastim_data.duration_as_array[1], 4)
 
 
 def test_serialize_rehastim_data():
@@ -197,9 +199,17 @@ def test_serialize_rehastim_data():
 
     # Check that the data is correct
     assert serialized_data["t0"] == rehastim_data.t0.timestamp()
-    assert len(serialized_data["data"]) == len(rehastim_data)
+    assert serialized_data["time"].shape == (len(rehastim_data),)
+    assert serialized_data["duration"].shape == (len(rehastim_data),)
+    assert serialized_data["channel_indices"].shape == (2, len(rehastim_data))
+    assert serialized_data["amplitudes"].shape == (2, len(rehastim_data))
     for index in range(len(rehastim_data)):
-        assert serialized_data["data"][index] == rehastim_data.sample_block(index=index)
+        t, duration, channels = rehastim_data.sample_block(index=index)
+        assert serialized_data["time"][index] == t
+        assert serialized_data["duration"][index] == duration
+        for channel_index, channel in enumerate(channels):
+            assert serialized_data["channel_indices"][channel_index, index] == channel.channel_index
+            assert serialized_data["amplitudes"][channel_index, index] == channel.amplitude
 
     # Serialize the data for json
     serialized_data = rehastim_data.serialize(to_json=True)
@@ -237,6 +247,317 @@ def test_save_and_load():
     np.testing.assert_almost_equal(rehastim_data_loaded.amplitude_as_array, rehastim_data.amplitude_as_array)
 
     # The copy is a deep copy
-    rehastim_data_loaded._data[1] = (0, 0, 0)
-    np.testing.assert_almost_equal(rehastim_data_loaded._data[1][1:][0], 0)
-    np.testing.assert_almost_equal(rehastim_data._data[1][1:][0], 4)
+    rehastim_data_loaded._duration[1] = 0
+    np.testing.assert_almost_equal(rehastim_data_loaded.duration_as_array[1], 0)
+    np.testing.assert_almost_equal(rehastim_data.duration_as_array[1], 4)
+
+
+def test_deserialize_list_of_events():
+    rehastim_data = RehastimData()
+
+    # Add data
+    _generate_data(rehastim_data)
+
+    # Data serialized as a list of (time, duration, channels) events are still accepted
+    rehastim_data_loaded = RehastimData.deserialize(
+        {"t0": rehastim_data.t0.timestamp(), "data": rehastim_data.sample_block(index=slice(None))}
+    )
+
+    # Check that the data is correct
+    assert len(rehastim_data_loaded) == len(rehastim_data)
+    np.testing.assert_almost_equal(rehastim_data_loaded.time, rehastim_data.time)
+    np.testing.assert_almost_equal(rehastim_data_loaded.duration_as_array, rehastim_data.duration_as_array)
+    np.testing.assert_almost_equal(rehastim_data_loaded.amplitude_as_array, rehastim_data.amplitude_as_array)
+
+
+def test_undefined_duration():
+    rehastim_data = RehastimData()
+
+    # Add data with an undefined duration
+    _generate_data(rehastim_data)
+    rehastim_data.add(now=31, duration=None, channels=None)
+
+    # The last event is not reported until its duration is known
+    assert len(rehastim_data) == 4
+    assert rehastim_data.sample_block(index=-1)[1] is None
+    np.testing.assert_almost_equal(rehastim_data.time, [1, 11, 21])
+    assert rehastim_data.amplitude_as_array.shape == (2, 3)
+
+    # The duration is set when the next event comes in
+    rehastim_data.add(now=35, duration=0, channels=None)
+    np.testing.assert_almost_equal(rehastim_data.time, [1, 11, 21, 31, 35])
+    np.testing.assert_almost_equal(rehastim_data.duration_as_array, [2, 4, 6, 4, 0])
+
+
+def test_block_data_between():
+    rehastim_data = RehastimData()
+
+    # Add data
+    _generate_data(rehastim_data)
+
+    # Get the data back between two times
+    data = rehastim_data.sample_block_between(t0=5, tf=21)
+    assert len(data) == 2
+    assert [sample[0] for sample in data] == [11, 21]
+    assert rehastim_data.sample_block_between(t0=22, tf=30) == []
+
+
+def test_pickle_channel():
+    channel = pickle.loads(pickle.dumps(Channel(channel_index=3, amplitude=12)))
+    assert channel.channel_index == 3
+    assert channel.amplitude == 12
+
+    # Channels pickled by previous versions carry their attributes in a dictionary
+    channel = Channel.__new__(Channel)
+    channel.__setstate__({"channel_index": 3, "amplitude": 12})
+    assert channel.channel_index == 3
+    assert channel.amplitude == 12
+
+
+def test_add_same_channels_modified_in_place():
+    rehastim_data = RehastimData()
+
+    # The devices send the same channels each time, modifying them in place
+    channels = (Channel(channel_index=1, amplitude=2), Channel(channel_index=2, amplitude=4))
+    rehastim_data.add(now=1, duration=2, channels=channels)
+    channels[0].amplitude = 6
+    rehastim_data.add(now=11, duration=4, channels=channels)
+
+    # Check that the data is correct
+    np.testing.assert_almost_equal(rehastim_data.amplitude_as_array, [[2, 6], [4, 4]])
+
+
+def test_load_pickled_file():
+    rehastim_data = RehastimData()
+
+    # Add data
+    _generate_data(rehastim_data)
+
+    # Files saved by previous versions were pickled lists of events
+    with open("data.pkl", "wb") as f:
+        pickle.dump({"t0": rehastim_data.t0.timestamp(), "data": rehastim_data.sample_block(index=slice(None))}, f)
+    rehastim_data_loaded = RehastimData.load("data.pkl")
+    os.remove("data.pkl")
+
+    # Check that the data is correct
+    assert rehastim_data_loaded.t0 == rehastim_data.t0
+    np.testing.assert_almost_equal(rehastim_data_loaded.time, rehastim_data.time)
+    np.testing.assert_almost_equal(rehastim_data_loaded.duration_as_array, rehastim_data.duration_as_array)
+    np.testing.assert_almost_equal(rehastim_data_loaded.amplitude_as_array, rehastim_data.amplitude_as_array)
+
+
+def test_add_mixed_channel_types():
+    rehastim_data = RehastimData()
+
+    # Add data
+    rehastim_data.add(
+        now=1,
+        duration=2,
+        channels=(
+            pyScienceModeChannel(mode=Modes.SINGLE, no_channel=1, amplitude=2, device_type=Device.Rehastim2),
+            Channel(channel_index=2, amplitude=4),
+        ),
+    )
+
+    # Check that the data is correct
+    _, _, channels = rehastim_data.sample_block(index=0)
+    assert [channel.channel_index for channel in channels] == [1, 2]
+    assert [channel.amplitude for channel in channels] == [2, 4]
+
+
+def test_channels_storage():
+    rehastim_data = RehastimData()
+
+    # Add data
+    _generate_data(rehastim_data)
+
+    # Channels are stored in compact arrays, one contiguous row per channel, that the accessors do not copy
+    assert rehastim_data._channel_indices.dtype == np.int16
+    assert rehastim_data._amplitudes.dtype == np.float64
+    assert rehastim_data._amplitudes.flags["C_CONTIGUOUS"]
+    assert np.shares_memory(rehastim_data.amplitude_as_array, rehastim_data._amplitudes)
+
+
+def test_bounded_capacity():
+    with pytest.raises(ValueError, match="The capacity must be at least 1."):
+        RehastimData(capacity=0)
+
+    rehastim_data = RehastimData(capacity=3)
+    assert rehastim_data.capacity == 3
+    assert RehastimData().capacity is None
+
+    # Add more data than the capacity, the last one with an undefined duration
+    for i in range(100):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+    rehastim_data.add(now=100, duration=None, channels=None)
+
+    # Only the most recent events are kept, and the memory used stays bounded
+    assert len(rehastim_data) == 3
+    np.testing.assert_almost_equal(rehastim_data.time, [98, 99])
+    np.testing.assert_almost_equal(rehastim_data.duration_as_array, [1, 1])
+    np.testing.assert_almost_equal(rehastim_data.amplitude_as_array, [[98, 99]])
+    assert [sample[0] for sample in rehastim_data.sample_block(index=slice(None))] == [98, 99, 100]
+    assert rehastim_data.sample_block(index=-1)[1] is None
+    assert rehastim_data._time.shape[0] <= 6
+
+    # The capacity is kept by the copy and applies to the initial data
+    rehastim_data_copied = rehastim_data.copy
+    assert rehastim_data_copied.capacity == 3
+    np.testing.assert_almost_equal(rehastim_data_copied.time, [98, 99])
+    rehastim_data = RehastimData(data=rehastim_data.sample_block(index=slice(None)), capacity=2)
+    assert [sample[0] for sample in rehastim_data.sample_block(index=slice(None))] == [99, 100]
+
+
+def test_bounded_capacity_persisted():
+    rehastim_data = RehastimData(capacity=3)
+    for i in range(10):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+
+    # The capacity is only serialized if it is bounded
+    assert rehastim_data.serialize()["capacity"] == 3
+    assert rehastim_data.serialize(to_json=True)["capacity"] == 3
+    assert "capacity" not in RehastimData().serialize()
+
+    # The capacity is kept through serialize/deserialize and save/load
+    rehastim_data_deserialized = RehastimData.deserialize(rehastim_data.serialize())
+    rehastim_data.save("data.npz")
+    rehastim_data_loaded = RehastimData.load("data.npz")
+    os.remove("data.npz")
+    for out in (rehastim_data_deserialized, rehastim_data_loaded):
+        assert out.capacity == 3
+        np.testing.assert_almost_equal(out.time, [7, 8, 9])
+        out.add(now=10, duration=1, channels=None)
+        np.testing.assert_almost_equal(out.time, [8, 9, 10])
+    assert RehastimData.deserialize(RehastimData().serialize()).capacity is None
+
+    # Only the most recent events are kept if there are more than the capacity
+    serialized = RehastimData(data=rehastim_data.sample_block(index=slice(None))).serialize()
+    serialized["capacity"] = 2
+    np.testing.assert_almost_equal(RehastimData.deserialize(serialized).time, [8, 9])
+
+
+def test_amplitude_round_trip():
+    rehastim_data = RehastimData()
+
+    # 12.3 cannot be represented exactly in single precision, so it must come back exactly as it was entered
+    rehastim_data.add(now=1, duration=2, channels=(Channel(channel_index=1, amplitude=12.3),))
+    rehastim_data.add(now=3, duration=2, channels=None)
+    assert rehastim_data.sample_block(index=0)[2][0].amplitude == 12.3
+    assert rehastim_data.amplitude_as_array[0, 1] == 12.3
+    assert rehastim_data.serialize(to_json=True)["data"][0][2][0]["amplitude"] == 12.3
+
+    rehastim_data.save("data.pkl")
+    rehastim_data_loaded = RehastimData.load("data.pkl")
+    os.remove("data.pkl")
+    assert rehastim_data_loaded.sample_block(index=0)[2][0].amplitude == 12.3
+    assert RehastimData(data=rehastim_data.sample_block(index=slice(None))).amplitude_as_array[0, 1] == 12.3
+
+
+def test_accessors_are_read_only():
+    rehastim_data = RehastimData()
+
+    # Add data
+    _generate_data(rehastim_data)
+
+    # The accessors do not copy the data, so they cannot be used to modify them
+    with pytest.raises(ValueError, match="read-only"):
+        rehastim_data.time[0] = 0
+    with pytest.raises(ValueError, match="read-only"):
+        rehastim_data.duration_as_array[0] = 0
+    with pytest.raises(ValueError, match="read-only"):
+        rehastim_data.amplitude_as_array[0, 0] = 0
+    time = rehastim_data.time
+    with pytest.raises(ValueError, match="read-only"):
+        time -= rehastim_data.t0.timestamp()
+
+    # Nor can the serialized arrays
+    serialized = rehastim_data.serialize()
+    for key in ("time", "duration", "channel_indices", "amplitudes"):
+        with pytest.raises(ValueError, match="read-only"):
+            serialized[key][..., 0] = -5
+    np.testing.assert_almost_equal(rehastim_data.time, [1, 11, 21])
+
+    # The data can still be added afterwards
+    rehastim_data.add(now=31, duration=8, channels=None)
+    np.testing.assert_almost_equal(rehastim_data.time, [1, 11, 21, 31])
+    np.testing.assert_almost_equal(rehastim_data.amplitude_as_array, [[2, 2, 8, 8], [4, 4, 10, 10]])
+
+
+def test_views_are_not_moved():
+    rehastim_data = RehastimData(capacity=4)
+    for i in range(4):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+
+    # Dropping the oldest events and moving the window back to the beginning of the arrays do not change the views
+    time = rehastim_data.time
+    amplitudes = rehastim_data.amplitude_as_array
+    for i in range(4, 100):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+    np.testing.assert_almost_equal(time, [0, 1, 2, 3])
+    np.testing.assert_almost_equal(amplitudes, [[0, 1, 2, 3]])
+    np.testing.assert_almost_equal(rehastim_data.time, [96, 97, 98, 99])
+
+    # Nor does clearing the data and adding new ones
+    rehastim_data.clear()
+    for i in range(100, 103):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+    time = rehastim_data.time
+    rehastim_data.clear()
+    for i in range(200, 203):
+        rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+    np.testing.assert_almost_equal(time, [100, 101, 102])
+    np.testing.assert_almost_equal(rehastim_data.time, [200, 201, 202])
+
+
+def _read_sample_block(rehastim_data: RehastimData) -> tuple[list[float], list[float]]:
+    events = rehastim_data.sample_block(index=slice(None))
+    return [event[0] for event in events], [event[2][0].amplitude for event in events]
+
+
+def _read_sample_block_between(rehastim_data: RehastimData) -> tuple[list[float], list[float]]:
+    events = rehastim_data.sample_block_between(t0=0, tf=np.inf)
+    return [event[0] for event in events], [event[2][0].amplitude for event in events]
+
+
+def _read_serialize_to_json(rehastim_data: RehastimData) -> tuple[list[float], list[float]]:
+    events = rehastim_data.serialize(to_json=True)["data"]
+    return [event[0] for event in events], [event[2][0]["amplitude"] for event in events]
+
+
+def _read_serialize(rehastim_data: RehastimData) -> tuple[list[float], list[float]]:
+    serialized = rehastim_data.serialize()
+    return serialized["time"].tolist(), serialized["amplitudes"][0].tolist()
+
+
+@pytest.mark.parametrize(
+    "read", (_read_sample_block, _read_sample_block_between, _read_serialize_to_json, _read_serialize)
+)
+def test_bounded_capacity_read_while_adding(read):
+    rehastim_data = RehastimData(capacity=8)
+    rehastim_data.add(now=0, duration=1, channels=(Channel(channel_index=1, amplitude=0),))
+
+    # Events are added by one thread while another one reads them, as the devices and the runner do
+    is_adding = True
+
+    def add_events():
+        nonlocal is_adding
+        for i in range(1, 50000):
+            rehastim_data.add(now=i, duration=1, channels=(Channel(channel_index=1, amplitude=i),))
+        is_adding = False
+
+    # Switch between the threads as often as possible so they interleave in the middle of the reads and writes
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread = threading.Thread(target=add_events)
+    thread.start()
+    try:
+        while is_adding:
+            # Each read must be a consistent window of consecutive events
+            times, amplitudes = read(rehastim_data)
+            assert 1 <= len(times) <= 8
+            assert times == list(range(int(times[0]), int(times[0]) + len(times)))
+            assert amplitudes == times
+    finally:
+        thread.join()
+        sys.setswitchinterval(switch_interval)
+    np.testing.assert_almost_equal(rehastim_data.time, range(49992, 50000))
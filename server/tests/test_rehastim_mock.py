@@ -96,6 +96,23 @@ def test_stimulate_for_a_specific_duration():
     assert not device.stimulation_active
 
 
+def test_dispose_stops_pending_stimulation():
+    durations = []
+
+    def stimulation_callback(current_time, duration, channels):
+        durations.append(duration)
+
+    rehastim = RehastimLokomatMock(port="NoPort")
+    rehastim.register_to_on_stimulation_changed(stimulation_callback)
+    rehastim.initialize_stimulation()
+
+    # The stimulation is still running when the device is disposed, so it is stopped before the device goes away
+    rehastim.start_stimulation(duration=10)
+    rehastim.dispose()
+    assert durations == [10, 0]
+    assert len(rehastim._stop_stimulation_timers) == 0
+
+
 def test_resuming_stimulation():
     rehastim = RehastimLokomatMock(port="NoPort")
 
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from lokomat_fes import Data
+from lokomat_fes.scheduler import data_analyser
+from lokomat_fes.scheduler.data_analyser import DataAnalyser, Side
+
+
+@pytest.fixture(params=["compiled", "pure_python"])
+def is_compiled(request, monkeypatch) -> bool:
+    """Run the test with the functions compiled by numba and with their pure Python version"""
+    is_numba_compiled = hasattr(data_analyser._percentage_of_strides, "py_func")
+    if request.param == "compiled":
+        if not is_numba_compiled:
+            pytest.skip("numba is not installed")
+        return True
+
+    if is_numba_compiled:
+        monkeypatch.setattr(data_analyser, "_percentage_of_strides", data_analyser._percentage_of_strides.py_func)
+        monkeypatch.setattr(data_analyser, "_percentage_of_stride", data_analyser._percentage_of_stride.py_func)
+    return False
+
+
+def _data_from_hips(previous_hip: np.ndarray, current_hip: np.ndarray) -> Data:
+    data = Data()
+    data.nidaq.add(np.arange(previous_hip.shape[0]) * 0.001, previous_hip[np.newaxis, :])
+    data.nidaq.add(np.arange(current_hip.shape[0]) * 0.001, current_hip[np.newaxis, :])
+    return data
+
+
+def _reference_percentage_of_stride(previous_data: np.ndarray, current_data: np.ndarray, side: Side) -> float:
+    """Compute the percentage of the stride cycle of one side directly from the hip samples"""
+    previous_hip = np.mean(previous_data[0])
+    current_hip = np.mean(current_data[0])
+    if side == Side.RIGHT:
+        previous_hip = -previous_hip
+        current_hip = -current_hip
+
+    if current_hip >= 0 and current_hip > previous_hip:
+        return 0 + 0.25 * current_hip
+    elif current_hip >= 0 and current_hip < previous_hip:
+        return 0.25 + 0.25 * (1 - current_hip)
+    elif current_hip < 0 and current_hip < previous_hip:
+        return 0.5 + 0.25 * np.abs(previous_hip)
+    elif current_hip < 0 and current_hip > previous_hip:
+        return 0.75 + 0.25 * (1 - np.abs(previous_hip))
+    else:
+        return -1
+
+
+def test_not_enough_data(is_compiled):
+    data = Data()
+    assert DataAnalyser.percentage_of_strides(data) == (-1, -1)
+
+    data.nidaq.add(np.array([0.0]), np.array([[0.5]]))
+    assert DataAnalyser.percentage_of_strides(data) == (-1, -1)
+    assert DataAnalyser.percentage_of_stride(data, Side.LEFT) == -1
+    assert DataAnalyser.percentage_of_stride(data, Side.RIGHT) == -1
+
+
+def test_equal_samples(is_compiled):
+    # The stride cycle cannot be determined if the hip did not move
+    data = _data_from_hips(np.array([0.5, 0.5]), np.array([0.25, 0.75]))
+    assert DataAnalyser.percentage_of_strides(data) == (-1, -1)
+
+
+def test_right_side_is_inverted(is_compiled):
+    # The left hip goes up in the positive values (first quarter), so the right one goes down in the negative values
+    # (third quarter)
+    data = _data_from_hips(np.array([0.2]), np.array([0.4]))
+    left, right = DataAnalyser.percentage_of_strides(data)
+    assert left == pytest.approx(0.1)
+    assert right == pytest.approx(0.55)
+    assert DataAnalyser.percentage_of_stride(data, Side.LEFT) == left
+    assert DataAnalyser.percentage_of_stride(data, Side.RIGHT) == right
+
+    # And the other way around (second and fourth quarters)
+    data = _data_from_hips(np.array([-0.4]), np.array([-0.2]))
+    left, right = DataAnalyser.percentage_of_strides(data)
+    assert left == pytest.approx(0.75 + 0.25 * 0.6)
+    assert right == pytest.approx(0.25 + 0.25 * 0.8)
+
+
+def test_matches_reference(is_compiled):
+    rng = np.random.default_rng(42)
+    for _ in range(3000):
+        n_frames = rng.integers(1, 20)
+        previous_data = rng.uniform(-1, 1, (2, n_frames))
+        current_data = rng.uniform(-1, 1, (2, n_frames))
+        if rng.random() < 0.05:
+            current_data = previous_data.copy()  # Make sure the equal samples are also tested
+
+        data = Data()
+        data.nidaq.add(np.arange(n_frames) * 0.001, previous_data)
+        data.nidaq.add(np.arange(n_frames) * 0.001, current_data)
+        left, right = DataAnalyser.percentage_of_strides(data)
+        expected = (
+            _reference_percentage_of_stride(previous_data, current_data, Side.LEFT),
+            _reference_percentage_of_stride(previous_data, current_data, Side.RIGHT),
+        )
+        if is_compiled:
+            # numba may sum the samples in a different order than numpy, which can change the last bit of the mean
+            np.testing.assert_allclose((left, right), expected, rtol=1e-12, atol=1e-15)
+        else:
+            assert (left, right) == expected
@@ -0,0 +1,138 @@
+from functools import partial
+import json
+import os
+from operator import ge
+
+import numpy as np
+import pytest
+
+from lokomat_fes import Data
+from lokomat_fes.scheduler.automatic_stimulation_rule import AutomaticStimulationRule, _should_stimulate
+from lokomat_fes.scheduler.data_analyser import DataAnalyser, Side
+
+
+def _default_rules() -> list[dict]:
+    folder = os.path.join(os.path.dirname(__file__), "..", "lokomat_fes", "scheduler")
+    with open(os.path.join(folder, "default_stimulations_schedules_rules.json")) as f:
+        return json.load(f)
+
+
+def _add_block(data: Data, block_index: int, n_frames: int = 10):
+    t = np.arange(block_index * n_frames, (block_index + 1) * n_frames) * 0.001
+    data.nidaq.add(t, np.sin(2 * np.pi * 1.3 * t)[np.newaxis, :])
+
+
+def _reference_stimulation_amplitudes(
+    rule: AutomaticStimulationRule, state: dict, current_time: float, data: Data, amplitude_out: list[float]
+):
+    """Evaluate the rule from the stride percentages computed separately for each side at every call"""
+    stride_left = DataAnalyser.percentage_of_stride(data, Side.LEFT)
+    stride_right = DataAnalyser.percentage_of_stride(data, Side.RIGHT)
+    if stride_left < 0 or stride_right < 0:
+        return
+
+    started_at = state.get("started_at")
+    time_since_last_stim = current_time - started_at if started_at is not None else None
+    start = rule._start_stimulating_rule(time_since_last_stim, stride_left, stride_right)
+    if rule._continue_stimulating_rule is not None:
+        stop = not start or not rule._continue_stimulating_rule(time_since_last_stim, stride_left, stride_right)
+    else:
+        stop = rule._end_stimulating_rule(time_since_last_stim, stride_left, stride_right)
+
+    if started_at is not None and stop:
+        state["started_at"] = None
+        for index in range(len(amplitude_out)):
+            amplitude_out[index] = 0
+    elif started_at is None and start:
+        state["started_at"] = current_time
+        for amplitude_index, i in enumerate(rule._channels):
+            amplitude_out[i] = rule._amplitudes[amplitude_index]
+
+
+def test_should_stimulate_side():
+    condition = partial(_should_stimulate, duration=None, gait_percentage=0.5, comparison=ge)
+
+    # Only the stride percentage of the requested side is compared
+    assert condition(None, 0.6, 0.4, side=Side.LEFT)
+    assert not condition(None, 0.4, 0.6, side=Side.LEFT)
+    assert condition(None, 0.4, 0.6, side=Side.RIGHT)
+    assert not condition(None, 0.6, 0.4, side=Side.RIGHT)
+
+    # A condition built without a valid side is rejected
+    with pytest.raises(ValueError, match="side must be either 'left' or 'right'"):
+        condition(None, 0.6, 0.4, side=None)
+    with pytest.raises(ValueError, match="side must be either 'left' or 'right'"):
+        condition(None, 0.6, 0.4, side=Side.BOTH)
+
+
+def test_stride_percentages_computed_once_per_block(monkeypatch):
+    calls = []
+    percentage_of_strides = DataAnalyser.percentage_of_strides
+
+    def counted_percentage_of_strides(data: Data) -> tuple[float, float]:
+        calls.append(data.nidaq.sample_block(index=-1, unsafe=True)[1])
+        return percentage_of_strides(data)
+
+    monkeypatch.setattr(DataAnalyser, "percentage_of_strides", staticmethod(counted_percentage_of_strides))
+    data = Data()
+    rule = AutomaticStimulationRule.from_json(_default_rules()[0])
+    amplitudes = [None] * 8
+
+    # Computed on the first tick of a block, then reused for the other ticks of that same block
+    _add_block(data, 0)
+    _add_block(data, 1)
+    for i in range(5):
+        rule.stimulation_amplitudes(i * 0.001, data, amplitudes)
+    assert len(calls) == 1
+    assert calls[0] is data.nidaq.sample_block(index=-1, unsafe=True)[1]
+
+    # A new block is analysed as soon as it comes in
+    _add_block(data, 2)
+    rule.stimulation_amplitudes(0.005, data, amplitudes)
+    assert len(calls) == 2
+    assert calls[1] is data.nidaq.sample_block(index=-1, unsafe=True)[1]
+    rule.stimulation_amplitudes(0.006, data, amplitudes)
+    assert len(calls) == 2
+
+    # Clearing the data invalidates the previous values
+    data.clear()
+    rule.stimulation_amplitudes(0.007, data, amplitudes)
+    assert len(calls) == 3
+    assert rule._last_stride_left == -1 and rule._last_stride_right == -1
+    _add_block(data, 0)
+    _add_block(data, 1)
+    rule.stimulation_amplitudes(0.008, data, amplitudes)
+    assert len(calls) == 4
+    assert (rule._last_stride_left, rule._last_stride_right) == (
+        DataAnalyser.percentage_of_stride(data, Side.LEFT),
+        DataAnalyser.percentage_of_stride(data, Side.RIGHT),
+    )
+
+
+@pytest.mark.parametrize("rule_json", _default_rules(), ids=lambda rule_json: rule_json["name"])
+def test_stimulation_amplitudes_match_reference(rule_json):
+    rule = AutomaticStimulationRule.from_json(rule_json)
+    reference_rule = AutomaticStimulationRule.from_json(rule_json)
+    reference_state = {}
+    data = Data()
+    rng = np.random.default_rng(42)
+
+    current_time = 0
+    nb_stimulations = 0
+    for block_index in range(600):
+        if block_index % 97 == 50:
+            data.clear()
+        _add_block(data, block_index)
+
+        # The scheduler ticks a variable number of times between two blocks
+        for _ in range(rng.integers(0, 5)):
+            current_time += 0.001
+            amplitudes = [None] * 8
+            rule.stimulation_amplitudes(current_time, data, amplitudes)
+            reference_amplitudes = [None] * 8
+            _reference_stimulation_amplitudes(reference_rule, reference_state, current_time, data, reference_amplitudes)
+            assert amplitudes == reference_amplitudes
+            nb_stimulations += amplitudes != [None] * 8
+
+    # Make sure the stimulation actually started and stopped
+    assert nb_stimulations > 2